@@ -5,72 +5,214 @@ A tool for comparing first-day and second-week class lists
 to identify adds and drops.
 Part of the PCC Classlist Party Pack.
 """
+import openpyxl
 import pandas as pd
 import tkinter as tk
 from tkinter import filedialog
 
-# Set up the Tkinter root window (this is needed to open the file dialog)
-root = tk.Tk()
-root.withdraw()  # Hide the root window, we only want the file dialog
-
-# Ask the user to select the first class list (from the first week)
-first_week_file = filedialog.askopenfilename(title="Select the First Week Class List",
-                                             filetypes=[("Excel files", "*.xlsx")])
-
-# Ask the user to select the second class list (from the second Wednesday)
-second_week_file = filedialog.askopenfilename(title="Select the Second Week Class List",
-                                              filetypes=[("Excel files", "*.xlsx")])
-
-# Load the selected files into pandas (Excel format)
-first_week_df = pd.read_excel(first_week_file, sheet_name=None)  # Load all sheets
-second_week_df = pd.read_excel(second_week_file, sheet_name=None)  # Load all sheets
-
-# Initialize lists to hold the added and dropped students
-added_students = []
-dropped_students = []
-
-# Iterate over each sheet (representing a class) in the first week's file
-for crn, first_week_class in first_week_df.items():
-    # Check if the same class (CRN) exists in the second week's file
-    if crn in second_week_df:
-        second_week_class = second_week_df[crn]
-
-        # Merge the first and second week dataframes for the class based on G Number (students)
-        merged_df = pd.merge(first_week_class, second_week_class, on=["G Number"], how="outer", indicator=True)
-
-        # Add suffixes to the columns to distinguish between first week and second week data
-        merged_df = pd.merge(first_week_class, second_week_class, on=["G Number"], how="outer", indicator=True,
-                             suffixes=('_first_week', '_second_week'))
-
-        # Identify added students (present in the second week but not the first week)
-        added_students_class = merged_df[merged_df['_merge'] == 'right_only'][
-            ['First Name_second_week', 'Last Name_second_week', 'G Number', 'PCC email address_second_week',
-             'Class_second_week', 'Term_second_week', 'CRN_second_week']]
-        added_students_class.columns = ['First Name', 'Last Name', 'G Number', 'PCC email address', 'Class', 'Term',
-                                        'CRN']
-        added_students.extend(added_students_class.values.tolist())
-
-        # Identify dropped students (present in the first week but not the second week)
-        dropped_students_class = merged_df[merged_df['_merge'] == 'left_only'][
-            ['First Name_first_week', 'Last Name_first_week', 'G Number', 'PCC email address_first_week',
-             'Class_first_week', 'Term_first_week', 'CRN_first_week']]
-        dropped_students_class.columns = ['First Name', 'Last Name', 'G Number', 'PCC email address', 'Class', 'Term',
-                                          'CRN']
-        dropped_students.extend(dropped_students_class.values.tolist())
-
-# Convert the lists to DataFrames for easy export to Excel
-added_df = pd.DataFrame(added_students,
-                        columns=['First Name', 'Last Name', 'G Number', 'PCC email address', 'Class', 'Term', 'CRN'])
-dropped_df = pd.DataFrame(dropped_students,
-                          columns=['First Name', 'Last Name', 'G Number', 'PCC email address', 'Class', 'Term', 'CRN'])
-
-# **De-duplication Step**: Remove duplicates in the final DataFrames based on G Number and CRN
-added_df = added_df.drop_duplicates(subset=['G Number', 'CRN'])
-dropped_df = dropped_df.drop_duplicates(subset=['G Number', 'CRN'])
-
-# Export the results to Excel
-with pd.ExcelWriter('students_changes.xlsx') as writer:
-    added_df.to_excel(writer, sheet_name="Added Students", index=False)
-    dropped_df.to_excel(writer, sheet_name="Dropped Students", index=False)
-
-print("Comparison completed. Added and dropped students have been saved as Excel files.")
+# Columns written to the output workbook, in order
+COLUMNS = ['First Name', 'Last Name', 'G Number', 'PCC email address', 'Class', 'Term', 'CRN']
+
+# Positions of the de-duplication key within a row tuple
+_G_NUMBER_POS = COLUMNS.index('G Number')
+_CRN_POS = COLUMNS.index('CRN')
+
+# xlsxwriter options: strings_to_formulas and strings_to_urls off, so emails and
+# names are written as plain strings. Keep in sync with classlist_parser/parser.py.
+XLSX_WRITER_KWARGS = {"options": {"strings_to_formulas": False, "strings_to_urls": False}}
+
+# The name, key and email columns are text; the string dtype avoids boxing each cell
+# as a Python object. Term and CRN keep their workbook types so they stay numbers in Excel.
+DTYPES = {c: "string" for c in ['First Name', 'Last Name', 'G Number', 'PCC email address', 'Class']}
+
+
+def load_class_lists(path: str) -> dict:
+    """
+    Load every sheet of a class list workbook, keeping only the columns we compare.
+    The workbook is streamed in read-only mode, so cells outside COLUMNS are never
+    turned into DataFrame values. Missing optional columns are filled with None,
+    but every sheet must have a G Number column, since it is the comparison key.
+    Args:
+        path (str): Path to the .xlsx class list.
+    Returns:
+        dict: Sheet name (the class/CRN) -> DataFrame with exactly COLUMNS, in order.
+    Raises:
+        ValueError: If a sheet's header row has no "G Number" column.
+    """
+    sheets = {}
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in workbook.worksheets:
+            header = next(ws.iter_rows(max_row=1, values_only=True), None) or ()
+            positions = {name: i for i, name in enumerate(header)}
+            if "G Number" not in positions:
+                raise ValueError(f'Sheet "{ws.title}" in {path} has no "G Number" column in its header row.')
+            picks = [positions.get(c) for c in COLUMNS]
+
+            # Stop reading each row after the last column we need
+            last_col = max((i for i in picks if i is not None), default=0) + 1
+
+            data = []
+            for row in ws.iter_rows(min_row=2, max_col=last_col, values_only=True):
+                values = [row[i] if i is not None and i < len(row) else None for i in picks]
+                if all(value is None for value in values):
+                    continue  # skip blank rows
+                data.append(values)
+
+            sheets[ws.title] = pd.DataFrame(data, columns=COLUMNS).astype(DTYPES)
+    finally:
+        workbook.close()
+    return sheets
+
+
+def factorize_g_numbers(*workbooks: dict) -> None:
+    """
+    Re-index every sheet by an integer code for its G Number, in place.
+    Codes are shared across all the given workbooks, so the same student gets
+    the same code in both weeks, and comparing codes is cheaper than hashing
+    G Number strings.
+    Args:
+        *workbooks (dict): Sheet name -> DataFrame mappings from load_class_lists().
+    """
+    sheets = [sheet for workbook in workbooks for sheet in workbook.values()]
+    if not sheets:
+        return
+
+    all_g = pd.concat([sheet["G Number"] for sheet in sheets], ignore_index=True)
+    codes, _ = pd.factorize(all_g, sort=False)
+
+    # Hand each sheet its slice of the codes, in the same order they were concatenated
+    start = 0
+    for workbook in workbooks:
+        for name, sheet in workbook.items():
+            workbook[name] = sheet.set_axis(codes[start:start + len(sheet)], axis=0)
+            start += len(sheet)
+
+
+def _first_positions(keys: list) -> dict:
+    """
+    Map each key to the position of its first occurrence.
+    A student listed twice in a sheet is reported from their first row,
+    as drop_duplicates() did.
+    Args:
+        keys (list): Row keys (G Number codes) in sheet order.
+    Returns:
+        dict: Key -> position of its first row.
+
+    >>> _first_positions([7, 3, 7, 5])
+    {5: 3, 7: 0, 3: 1}
+    """
+    return {key: pos for pos, key in reversed(list(enumerate(keys)))}
+
+
+def _by_g_number(rows: list, sheet: pd.DataFrame) -> list:
+    """
+    Sort row positions by the sheet's G Number, blanks last.
+    The old outer merge listed adds/drops in G Number order; this keeps that order.
+    """
+    g_numbers = sheet["G Number"].tolist()
+
+    def key(pos):
+        g = g_numbers[pos]
+        return (True, "") if pd.isna(g) else (False, g)
+
+    return sorted(rows, key=key)
+
+
+def diff_one(first_week_class: pd.DataFrame, second_week_class: pd.DataFrame) -> tuple:
+    """
+    Find the adds and drops for a single class.
+    Args:
+        first_week_class (pd.DataFrame): The class's first week sheet, indexed by G Number code.
+        second_week_class (pd.DataFrame): The class's second week sheet, indexed by G Number code.
+    Returns:
+        tuple: (added, dropped) lists of row tuples, in COLUMNS order,
+               sorted by G Number.
+    """
+    # Class sheets are small, so plain dict/set operations on the G Number codes
+    # beat pandas' index machinery. Map each code to its row position.
+    first_g = _first_positions(first_week_class.index.tolist())
+    second_g = _first_positions(second_week_class.index.tolist())
+
+    # Identify added students (present in the second week but not the first week)
+    added_rows = _by_g_number([second_g[g] for g in second_g.keys() - first_g.keys()], second_week_class)
+    added_students_class = second_week_class.iloc[added_rows]
+
+    # Identify dropped students (present in the first week but not the second week)
+    dropped_rows = _by_g_number([first_g[g] for g in first_g.keys() - second_g.keys()], first_week_class)
+    dropped_students_class = first_week_class.iloc[dropped_rows]
+
+    # Plain tuples let main() gather and de-duplicate rows without pandas
+    return (list(added_students_class.itertuples(index=False, name=None)),
+            list(dropped_students_class.itertuples(index=False, name=None)))
+
+
+def _unseen_rows(rows: list, seen: set) -> list:
+    """
+    Return the rows whose (G Number, CRN) key is not in seen, adding their keys to it.
+    """
+    unseen = []
+    for row in rows:
+        key = (row[_G_NUMBER_POS], row[_CRN_POS])
+        if key not in seen:
+            seen.add(key)
+            unseen.append(row)
+    return unseen
+
+
+def main() -> None:
+    """
+    Main entry point for the Classlist Party Remixer.
+
+    Asks for the first week and second week class lists, compares every class
+    that appears in both, and writes the added and dropped students to
+    students_changes.xlsx.
+    """
+    # Set up the Tkinter root window (this is needed to open the file dialog)
+    root = tk.Tk()
+    root.withdraw()  # Hide the root window, we only want the file dialog
+
+    # Ask the user to select the first class list (from the first week)
+    first_week_file = filedialog.askopenfilename(title="Select the First Week Class List",
+                                                 filetypes=[("Excel files", "*.xlsx")])
+
+    # Ask the user to select the second class list (from the second Wednesday)
+    second_week_file = filedialog.askopenfilename(title="Select the Second Week Class List",
+                                                  filetypes=[("Excel files", "*.xlsx")])
+
+    # Load the selected files into pandas, one DataFrame per sheet (class)
+    first_week_df = load_class_lists(first_week_file)
+    second_week_df = load_class_lists(second_week_file)
+
+    # Swap the G Number string keys for shared integer codes before diffing
+    factorize_g_numbers(first_week_df, second_week_df)
+
+    # Only classes (CRNs) present in both weeks can be compared
+    crns = [crn for crn in first_week_df if crn in second_week_df]
+
+    # Compare each class on its own
+    results = [diff_one(first_week_df[crn], second_week_df[crn]) for crn in crns]
+
+    # Gather every class's rows, then build each DataFrame once for easy export to Excel.
+    # **De-duplication Step**: keep only the first row for each (G Number, CRN)
+    added_students = []
+    dropped_students = []
+    seen_added = set()
+    seen_dropped = set()
+    for added, dropped in results:
+        added_students.extend(_unseen_rows(added, seen_added))
+        dropped_students.extend(_unseen_rows(dropped, seen_dropped))
+
+    added_df = pd.DataFrame(added_students, columns=COLUMNS)
+    dropped_df = pd.DataFrame(dropped_students, columns=COLUMNS)
+
+    # Export the results to Excel
+    with pd.ExcelWriter('students_changes.xlsx', engine="xlsxwriter", engine_kwargs=XLSX_WRITER_KWARGS) as writer:
+        added_df.to_excel(writer, sheet_name="Added Students", index=False)
+        dropped_df.to_excel(writer, sheet_name="Dropped Students", index=False)
+
+    print("Comparison completed. Added and dropped students have been saved as Excel files.")
+
+
+if __name__ == "__main__":
+    main()
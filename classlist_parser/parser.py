@@ -7,8 +7,9 @@ Part of the PCC Classlist Party Pack.
 
 import os
 import re
+import string
 import sys
-from collections import defaultdict
+from itertools import repeat
 from tkinter import Tk, filedialog, messagebox
 import json
 import pandas as pd
@@ -81,8 +82,27 @@ def load_settings() -> dict:
 
     return settings
 
+# xlsxwriter options: strings_to_formulas and strings_to_urls off, so emails and
+# names are written as plain strings. Keep in sync with adds_drops_tool/compare.py.
+XLSX_WRITER_KWARGS = {"options": {"strings_to_formulas": False, "strings_to_urls": False}}
+
+# Translation table that deletes every ASCII character not allowed in filenames
+_FILENAME_KEEP = frozenset(string.ascii_letters + string.digits + " _-")
+_FILENAME_TABLE = str.maketrans({chr(c): None for c in range(128) if chr(c) not in _FILENAME_KEEP})
+
 _TERM_TEXT_RE = re.compile(r'\b(Spring|Summer|Fall|Winter)\s+(20\d{2})\b', re.I)
 _TERM_CODE_RE = re.compile(r'\b(20\d{2}0[1-4])\b')  # e.g. 202501..202504
+# One line of page text is either a class header (CRN SUBJ NUM SEC Name)
+# or a student row containing a G-number
+_COURSE_PATTERN = (
+    r"^[ \t]*(?P<crn>\d{5})[ \t]+(?P<subj>\w+)[ \t]+(?P<num>\d+[A-Z]?)"
+    r"[ \t]+(?P<sec>\d)[ \t]+(?P<name>.*)$"
+)
+_STUDENT_PATTERN = r"^(?P<stu>.*?(?P<gnum>G\d{8}).*)$"
+_PAGE_RE = re.compile(f"{_COURSE_PATTERN}|{_STUDENT_PATTERN}", re.MULTILINE)
+# Pages without any G-number can't hold student rows, so only headers are scanned
+_COURSE_ONLY_RE = re.compile(_COURSE_PATTERN, re.MULTILINE)
+_GNUM_RE = re.compile(r"G\d{8}")
 
 def app_dir() -> str:
     """
@@ -208,10 +228,25 @@ def _safe_filename(s: str) -> str:
     """
     s = (s or "").strip()
     # Keep only letters, digits, spaces, underscores, and hyphens
-    s = re.sub(r'[^A-Za-z0-9 _\-]', '', s)
+    # (the table drops other ASCII; the encode drops everything non-ASCII)
+    s = s.translate(_FILENAME_TABLE).encode("ascii", "ignore").decode("ascii")
     # Collapse multiple spaces into one
-    s = re.sub(r'\s+', ' ', s).strip()
-    return s
+    return " ".join(s.split())
+
+def _write_sheet(book, sheet_name: str, header: list, rows, header_format) -> None:
+    """
+    Add a worksheet and write a header row followed by the data rows.
+    Args:
+        book: The xlsxwriter Workbook behind the pandas ExcelWriter.
+        sheet_name (str): Name of the new worksheet (at most 31 characters).
+        header (list): Column names for the first row.
+        rows: Iterable of row tuples, in header order.
+        header_format: xlsxwriter Format applied to the header row.
+    """
+    worksheet = book.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, header, header_format)
+    for row_idx, row in enumerate(rows, 1):
+        worksheet.write_row(row_idx, 0, row)
 
 def main() -> None:
     """
@@ -234,74 +269,91 @@ def main() -> None:
         # User cancelled; just exit quietly
         return
 
-    records = []
+    # One list per output column, appended in step for each student row
+    first_names = []
+    last_names = []
+    g_numbers = []
+    emails = []
+    classes = []
+    crns = []
     current_class = {}
 
+    # Bind the regex methods and settings used in the page loop once, up front
+    page_matches = _PAGE_RE.finditer
+    course_matches = _COURSE_ONLY_RE.finditer
+    has_gnum = _GNUM_RE.search
+    email_domain = settings["email_domain"]
+    allowed = settings.get("allowed_courses")
+    if allowed is not None:
+        allowed = frozenset(allowed)
+
     with pdfplumber.open(pdf_file) as pdf:
         # Detect the term while the file is open
         term_text = _detect_term_from_pdf(pdf)   # e.g. "Fall 2025" or ""
 
         for page in pdf.pages:
             text = (page.extract_text() or "")
-            lines = text.split("\n")
-
-            # --- Class header parsing: capture CRN, subject, course number, section, name ---
-            for line in lines:
-                course_match = re.match(r"\s*(\d{5})\s+(\w+)\s+(\d+[A-Z]?)\s+(\d)\s+(.*)", line)
-                if course_match:
-                    course_number = course_match.group(3)
+            # Drop the page's cached chars/layout now that we have its text,
+            # so memory stays flat on long class lists
+            page.close()
+
+            # Walk the page once; each match is a class header or a student row
+            skip_to = 0
+            # One scan for any G-number is far cheaper than trying the student pattern on every line
+            matches = page_matches(text) if has_gnum(text) else course_matches(text)
+            for m in matches:
+                # --- Class header parsing: capture CRN, subject, course number, section, name ---
+                if m.group("crn"):
+                    course_number = m.group("num")
 
                     # Optional course filter from settings
-                    allowed = settings.get("allowed_courses")
                     if allowed is not None and course_number not in allowed:
                         # Skip this class if it's not in the allowed list
                         current_class = {}
                     else:
                         current_class = {
-                            "CRN": course_match.group(1),
-                            "Subject": course_match.group(2),
+                            "CRN": m.group("crn"),
+                            "Subject": m.group("subj"),
                             "Course Number": course_number,
-                            "Section": course_match.group(4),
-                            "Course Name": course_match.group(5).strip(),
+                            "Section": m.group("sec"),
+                            "Course Name": m.group("name").strip(),
                         }
-
-            # --- Student rows ---
-            idx = 0
-            while idx < len(lines):
-                line = lines[idx]
-                gnum_match = re.search(r"(G\d{8})", line)
-                if gnum_match and current_class:
-                    try:
-                        # Extract "Last, First" before the G-number
-                        name_part = line.split(gnum_match.group(1))[0]
-                        last_first = name_part.split(None, 1)[1].split(',')
-                        last_name = last_first[0].strip()
-                        first_name = last_first[1].strip()
-                    except Exception:
-                        last_name, first_name = "", ""
-
-                    g_number = gnum_match.group(1)
-
-                    # Look for institutional email on the next line
-                    email = ""
-                    if idx + 1 < len(lines):
-                        email_line = lines[idx + 1].strip()
-                        if settings["email_domain"] in email_line:
-                            email = email_line.split()[0]
-
-                    records.append({
-                        "First Name": first_name,
-                        "Last Name": last_name,
-                        "G Number": g_number,
-                        "PCC email address": email,
-                        "Non-PCC email": "",
-                        "Class": f"{current_class.get('Subject')} {current_class.get('Course Number')}",
-                        "CRN": current_class.get("CRN"),
-                    })
-                    # Skip to the line after the email line
-                    idx += 2
-                else:
-                    idx += 1
+                    continue
+
+                # --- Student rows ---
+                if not current_class or m.start() < skip_to:
+                    # No class yet, or this is the email line of the previous student row
+                    continue
+
+                line = m.group("stu")
+                g_number = m.group("gnum")
+                try:
+                    # Extract "Last, First" before the G-number
+                    name_part = line.split(g_number)[0]
+                    last_first = name_part.split(None, 1)[1].split(',')
+                    last_name = last_first[0].strip()
+                    first_name = last_first[1].strip()
+                except Exception:
+                    last_name, first_name = "", ""
+
+                # Look for institutional email on the next line
+                email = ""
+                next_start = m.end() + 1
+                next_end = text.find("\n", next_start)
+                if next_end == -1:
+                    next_end = len(text)
+                email_line = text[next_start:next_end].strip()
+                if email_domain in email_line:
+                    email = email_line.split()[0]
+
+                first_names.append(first_name)
+                last_names.append(last_name)
+                g_numbers.append(g_number)
+                emails.append(email)
+                classes.append(f"{current_class.get('Subject')} {current_class.get('Course Number')}")
+                crns.append(current_class.get("CRN"))
+                # Skip the email line; resume with the line after it
+                skip_to = next_end
 
     # --- Build dynamic output name (now that pdf is closed) ---
     prefix = settings["output_name_prefix"]
@@ -314,19 +366,33 @@ def main() -> None:
 
     output_path = os.path.join(output_dir, out_name)
 
-    # Group records by Class+CRN for per-class sheets
-    grouped = defaultdict(list)
-    for rec in records:
-        grouped[f"{rec['Class']}_{rec['CRN']}"].append(rec)
+    records_df = pd.DataFrame({
+        "First Name": first_names,
+        "Last Name": last_names,
+        "G Number": g_numbers,
+        "PCC email address": emails,
+        "Non-PCC email": [""] * len(g_numbers),
+        "Class": classes,
+        "CRN": crns,
+    })
 
     # Write the Excel file
     try:
-        with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
-            pd.DataFrame(records).to_excel(writer, sheet_name="Combined", index=False)
-
-            for key, recs in grouped.items():
-                sheet_name = key[:31]  # Excel sheet name limit
-                pd.DataFrame(recs).to_excel(writer, sheet_name=sheet_name, index=False)
+        with pd.ExcelWriter(output_path, engine="xlsxwriter", engine_kwargs=XLSX_WRITER_KWARGS) as writer:
+            # Write rows with xlsxwriter directly; pandas' cell formatter is the slow part.
+            # Every sheet shares this one header format so they all look the same.
+            header = records_df.columns.tolist()
+            header_format = writer.book.add_format({"bold": True})
+
+            # Combined comes straight from the column lists
+            combined_rows = zip(first_names, last_names, g_numbers, emails, repeat(""), classes, crns)
+            _write_sheet(writer.book, "Combined", header, combined_rows, header_format)
+
+            # One sheet per Class+CRN, in the order the classes appear in the PDF
+            for (cls, crn), class_df in records_df.groupby(["Class", "CRN"], sort=False):
+                sheet_name = f"{cls}_{crn}"[:31]  # Excel sheet name limit
+                class_rows = class_df.itertuples(index=False, name=None)
+                _write_sheet(writer.book, sheet_name, header, class_rows, header_format)
 
         messagebox.showinfo("Done", f"Created:\n{output_path}")
 